@@ -3,21 +3,64 @@ Backend - Manages lab creation and student submissions
 """
 
 import os
+import re
 import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from grader import Grader
 
 
+SUBMISSION_PATTERN = re.compile(r'submission(\d+)\.py$')
+
+def _grade_student(labs_root, lab_name, student_name):
+    """Grade one student. Module-level so ProcessPoolExecutor can pickle it."""
+    grader = Grader(os.path.join(labs_root, lab_name))
+    return grader.grade_submission(student_name)
+
+
+def _grade_one(labs_root, lab_name, student_name):
+    """Like _grade_student, but failures become an error result instead of raising."""
+    try:
+        return _grade_student(labs_root, lab_name, student_name)
+    except Exception as e:
+        return {"error": str(e), "passed": 0, "total": 0, "results": []}
+
+
 class LabBackend:
     """Handles lab folder creation and student submission management."""
     
-    def __init__(self, labs_root="Labs"):
-        self.labs_root = os.path.abspath(labs_root)
+    def __init__(self, labs_root="Labs", max_workers=None):
+        self.labs_root = os.path.realpath(labs_root)
+        self.max_workers = max_workers
+        self._listing_cache = {}
+        self._listing_lock = threading.Lock()
+        self._pool = None
+        self._pool_lock = threading.Lock()
         if not os.path.exists(self.labs_root):
             os.makedirs(self.labs_root)
     
+    def _safe_path(self, *names):
+        """
+        Resolve labs_root/<names...>, rejecting names that could escape labs_root.
+        
+        Each name must be a single path component not starting with '.' (dot-folders such as
+        the answer-key cache, Labs/.cache, are reserved), and the resolved path (symlinks
+        included) must stay strictly inside labs_root. Not cached: names come straight from
+        requests, and a symlink swapped in later must still be caught.
+        """
+        for name in names:
+            if not name or name.startswith('.') or os.path.basename(name) != name:
+                raise ValueError(f"Invalid name: {name!r}")
+        
+        path = os.path.realpath(os.path.join(self.labs_root, *names))
+        if not path.startswith(self.labs_root + os.sep):
+            raise ValueError(f"Invalid name: {os.path.join(*names)!r}")
+        
+        return path
+    
     def create_lab(self, lab_name, solution_code, test_config):
         """Create a new lab. If exists, deletes old version including submissions."""
-        lab_path = os.path.join(self.labs_root, lab_name)
+        lab_path = self.get_lab_path(lab_name)
         
         if os.path.exists(lab_path):
             shutil.rmtree(lab_path)
@@ -37,15 +80,16 @@ class LabBackend:
     
     def submit_student_code(self, lab_name, student_name, student_code):
         """Submit student code. Renames existing main.py to submission#.py."""
-        student_folder = os.path.join(self.labs_root, lab_name, "Submissions", student_name)
+        student_folder = self.get_student_folder(lab_name, student_name)
         os.makedirs(student_folder, exist_ok=True)
         
         main_py_path = os.path.join(student_folder, "main.py")
         
         if os.path.exists(main_py_path):
-            submission_num = 1
-            while os.path.exists(os.path.join(student_folder, f"submission{submission_num}.py")):
-                submission_num += 1
+            # One directory read instead of probing submission1.py, submission2.py, ...
+            with os.scandir(student_folder) as it:
+                nums = [int(m.group(1)) for e in it if (m := SUBMISSION_PATTERN.match(e.name))]
+            submission_num = max(nums, default=0) + 1
             shutil.move(main_py_path, os.path.join(student_folder, f"submission{submission_num}.py"))
         
         with open(main_py_path, 'w') as f:
@@ -54,25 +98,76 @@ class LabBackend:
         return main_py_path
     
     def get_lab_path(self, lab_name):
-        return os.path.join(self.labs_root, lab_name)
+        return self._safe_path(lab_name)
     
     def get_student_folder(self, lab_name, student_name):
-        return os.path.join(self.labs_root, lab_name, "Submissions", student_name)
+        return self._safe_path(lab_name, "Submissions", student_name)
+    
+    def _cached_listdir(self, path):
+        """List subdirectories of path, re-scanning only when the directory's mtime changes."""
+        with self._listing_lock:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                self._listing_cache.pop(path, None)
+                return []
+            
+            hit = self._listing_cache.get(path)
+            if hit and hit[0] == mtime:
+                return hit[1]
+            
+            # Dot-folders (e.g. the answer-key cache, Labs/.cache) are never labs or students
+            with os.scandir(path) as it:
+                entries = [e.name for e in it if e.is_dir() and not e.name.startswith('.')]
+            self._listing_cache[path] = (mtime, entries)
+            return entries
     
     def list_labs(self):
-        if not os.path.exists(self.labs_root):
-            return []
-        return [d for d in os.listdir(self.labs_root) 
-                if os.path.isdir(os.path.join(self.labs_root, d))]
+        return self._cached_listdir(self.labs_root)
     
     def list_students(self, lab_name):
-        submissions_path = os.path.join(self.labs_root, lab_name, "Submissions")
-        if not os.path.exists(submissions_path):
-            return []
-        return [d for d in os.listdir(submissions_path)
-                if os.path.isdir(os.path.join(submissions_path, d))]
+        return self._cached_listdir(self._safe_path(lab_name, "Submissions"))
     
     def grade_student(self, lab_name, student_name):
         """Grade a student's submission."""
-        grader = Grader(self.get_lab_path(lab_name))
-        return grader.grade_submission(student_name)
+        self.get_student_folder(lab_name, student_name)  # Validate before touching the filesystem
+        return self._executor().submit(_grade_student, self.labs_root, lab_name, student_name).result()
+    
+    def _executor(self):
+        """
+        Process pool shared by every grading call, created on first use.
+        
+        One long-lived pool capped by max_workers (default: one per CPU) bounds the sandbox
+        jobs running at once across all requests, however many arrive concurrently.
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers or os.cpu_count() or 1)
+            return self._pool
+    
+    def grade_all_students(self, lab_name):
+        """Grade every student in a lab in parallel. Returns {student_name: result}."""
+        students = self.list_students(lab_name)
+        if not students:
+            return {}
+        
+        results = self._executor().map(_grade_one, [self.labs_root] * len(students),
+                                       [lab_name] * len(students), students, chunksize=1)
+        return dict(zip(students, results))
+    
+    def iter_grade_all_students(self, lab_name):
+        """Grade every student in a lab in parallel, yielding (student_name, result) as each finishes."""
+        students = self.list_students(lab_name)
+        if not students:
+            return
+        
+        pool = self._executor()
+        futures = {pool.submit(_grade_one, self.labs_root, lab_name, student): student
+                   for student in students}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # Client went away mid-stream: don't keep grading for nobody
+            for future in futures:
+                future.cancel()
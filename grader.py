@@ -3,11 +3,180 @@ Autograder - Generates test files and answer keys from solution code
 """
 
 import ast
+import functools
+import hashlib
+import io
+import json
 import os
+import secrets
+import shutil
 import subprocess
 import tempfile
+import threading
 from test_cases import TestCaseGenerator
-from run_in_sandbox import run_script
+from run_in_sandbox import run_script, staging_dir
+
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py")
+
+# Answer keys kept in Labs/.cache; the least recently used are evicted beyond this
+ANSWER_KEY_CACHE_SIZE = 256
+
+# Appended to every harness: encodes _results as JSON identically in every process. Tuples
+# become lists; sets (whose iteration order depends on the hash seed) and dicts with non-str
+# keys (which JSON would coerce or reject) become tagged, sorted forms; anything else is repr'd
+RESULTS_ENCODER = """import json as _json
+def _sort_key(_value):
+    return _json.dumps(_value, sort_keys=True)
+def _normalize(_value):
+    if _value is None or isinstance(_value, (str, int, float)):
+        return _value
+    if isinstance(_value, (list, tuple)):
+        return [_normalize(_item) for _item in _value]
+    if isinstance(_value, dict):
+        if all(isinstance(_key, str) for _key in _value):
+            return {_key: _normalize(_item) for _key, _item in _value.items()}
+        return {'__dict__': sorted(([_normalize(_key), _normalize(_item)] for _key, _item in _value.items()), key=_sort_key)}
+    if isinstance(_value, (set, frozenset)):
+        return {'__set__': sorted((_normalize(_item) for _item in _value), key=_sort_key)}
+    return repr(_value)
+print(_json.dumps(_normalize(_results)))
+"""
+
+# Warm interpreter shared by every Grader for trusted (solution) code; see worker.py
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _run_in_worker(source, timeout=5):
+    """
+    Run trusted source in the shared warm worker process.
+    
+    Returns:
+        dict with: returncode, stdout, stderr, success (same shape as run_script)
+    """
+    global _worker
+    
+    with _worker_lock:
+        if _worker is None or _worker.poll() is not None:
+            _worker = subprocess.Popen(
+                ['python', '-u', WORKER_SCRIPT],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL
+            )
+        worker = _worker
+        
+        data = source.encode('utf-8')
+        request_id = secrets.token_hex(8)
+        reply = []
+        try:
+            worker.stdin.write(b'%d %s\n' % (len(data), request_id.encode('ascii')) + data)
+            worker.stdin.flush()
+        except OSError as e:
+            _worker = None
+            return {"returncode": -1, "stdout": "", "stderr": str(e), "success": False}
+        
+        # Pipes can't be read with a timeout portably, so wait on a reader thread
+        reader = threading.Thread(target=lambda: reply.append(worker.stdout.readline()), daemon=True)
+        reader.start()
+        reader.join(timeout)
+        
+        if not reply or not reply[0]:
+            # Hung or crashed: discard this worker, the next call starts a fresh one
+            worker.kill()
+            _worker = None
+            stderr = f"Timeout after {timeout}s" if not reply else "Worker process exited"
+            return {"returncode": -1, "stdout": "", "stderr": stderr, "success": False}
+        
+        try:
+            result = json.loads(reply[0])
+            matched = isinstance(result, dict) and result.get("request_id") == request_id
+        except ValueError:
+            matched = False
+        
+        if not matched:
+            # Out of step with its requests: never trust this worker's replies again
+            worker.kill()
+            _worker = None
+            return {"returncode": -1, "stdout": "", "stderr": "Worker reply was corrupted", "success": False}
+        
+        return result
+
+
+def _check_results(results):
+    """Return decoded harness output if it is a list of result cases, else raise ValueError."""
+    if not isinstance(results, list) or not all(
+            isinstance(case, dict) and 'return_value' in case and 'heap_param_values' in case
+            for case in results):
+        raise ValueError(f"Malformed results: {str(results)[:200]}")
+    return results
+
+
+def _outdated_lab_error(path):
+    return ValueError(f"{os.path.basename(path)} was written by an older version of the "
+                      f"autograder; re-create this lab to grade it")
+
+
+def _load_lab_json(path):
+    """
+    Load one of a lab's JSON files (answer key, digests, test metadata).
+    
+    Labs created before these files became JSON hold Python reprs instead; those raise
+    ValueError with a message telling the teacher to re-create the lab.
+    """
+    with open(path) as f:
+        try:
+            return json.load(f)
+        except ValueError:
+            raise _outdated_lab_error(path) from None
+
+
+def _result_digest(case):
+    """Short stable digest of one parsed result case (key order independent)."""
+    encoded = json.dumps(case, sort_keys=True).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+def _write_script(source):
+    """
+    Write a grading script to a new temp file and return its path.
+    
+    Uses the sandbox staging dir when available (bind-mounted into the jail, on tmpfs),
+    else /dev/shm, else the system temp dir.
+    """
+    script_dir = staging_dir() or ('/dev/shm' if os.path.isdir('/dev/shm') else None)
+    fd, path = tempfile.mkstemp(suffix='.py', dir=script_dir)
+    try:
+        os.write(fd, source.encode('utf-8'))
+    finally:
+        os.close(fd)
+    return path
+
+
+def _prune_cache(cache_dir, max_entries=ANSWER_KEY_CACHE_SIZE):
+    """Delete the least recently used cache entries (by mtime) beyond max_entries."""
+    with os.scandir(cache_dir) as it:
+        entries = [(e.stat().st_mtime_ns, e.path) for e in it if e.name.endswith('.txt')]
+    
+    entries.sort(reverse=True)
+    for _, path in entries[max_entries:]:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass  # Pruned concurrently by another grader
+
+
+def _write_atomic(path, text):
+    """Write text to path via a temp file + os.replace so readers never see a partial file."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
 
 
 class Grader:
@@ -42,7 +211,7 @@ class Grader:
             for item in config:
                 if isinstance(item, dict) and "type" in item:
                     # Generate values from config
-                    values.extend(self._generate_from_config(item))
+                    values.extend(self.generator.generate_from_config(item))
                 else:
                     # Add literal value
                     values.append(item)
@@ -50,24 +219,7 @@ class Grader:
         
         # If it's a dict with type, generate values
         if isinstance(config, dict) and "type" in config:
-            return self._generate_from_config(config)
-        
-        return []
-    
-    def _generate_from_config(self, config):
-        """Generate values from a config dict."""
-        type_name = config.get("type", "num")
-        
-        if type_name == "num":
-            return self.generator.generate_num(**{k: v for k, v in config.items() if k != "type"})
-        elif type_name == "string":
-            return self.generator.generate_string(**{k: v for k, v in config.items() if k != "type"})
-        elif type_name == "bool_or_none":
-            return self.generator.generate_bool_or_none(**{k: v for k, v in config.items() if k != "type"})
-        elif type_name == "array":
-            return self.generator.generate_array(**{k: v for k, v in config.items() if k != "type"})
-        elif type_name == "dict":
-            return self.generator.generate_dict(**{k: v for k, v in config.items() if k != "type"})
+            return self.generator.generate_from_config(config)
         
         return []
     
@@ -76,40 +228,35 @@ class Grader:
         if output is None:
             output = os.path.join(self.solution_folder, "test_calls.txt")
             
-        calls = []
-        
-        for test in self.tests:
-            method = test["method"]
-            params = test["params"]
-            track_mutation = test.get("track_mutation", [])
-            
-            # Get test values for each param
-            param_values = {name: self._get_values(config) for name, config in params.items()}
-            
-            # Create test calls
-            max_tests = max(len(vals) for vals in param_values.values()) if param_values else 1
-            for i in range(max_tests):
-                args = []
-                tracked_values = {}
+        # Stream calls straight to disk, one per line, instead of building a list and joining it
+        with open(output, 'w', buffering=1 << 20) as f:
+            for test in self.tests:
+                method = test["method"]
+                params = test["params"]
+                track_mutation = test.get("track_mutation", [])
                 
-                for name in params.keys():
-                    value = param_values[name][i % len(param_values[name])]
-                    args.append(repr(value))
-                    # Only store values we need to track
-                    if name in track_mutation:
-                        tracked_values[name] = value
+                # Get test values for each param
+                param_values = {name: self._get_values(config) for name, config in params.items()}
                 
-                calls.append(f"{method}({','.join(args)})")
-                self.test_metadata.append(tracked_values)
-        
-        # Write to file, one per line
-        with open(output, 'w') as f:
-            f.write('\n'.join(calls))
+                # repr each distinct value once, not once per generated call
+                repr_values = {name: [repr(v) for v in vals] for name, vals in param_values.items()}
+                lengths = {name: len(vals) for name, vals in param_values.items()}
+                
+                # Tracked params are recorded by argument position, not by value
+                tracked_positions = {name: pos for pos, name in enumerate(params.keys()) if name in track_mutation}
+                
+                # Create test calls
+                max_tests = max(lengths.values()) if param_values else 1
+                for i in range(max_tests):
+                    args = ','.join([repr_values[name][i % lengths[name]] for name in params.keys()])
+                    f.write(f"{method}({args})\n")
+                    
+                    self.test_metadata.append(tracked_positions)
         
         # Save metadata alongside test calls
         metadata_file = output.replace('.txt', '_metadata.txt')
         with open(metadata_file, 'w') as f:
-            f.write(repr(self.test_metadata))
+            json.dump(self.test_metadata, f)
         
         return output
     
@@ -117,8 +264,12 @@ class Grader:
         """Load test metadata from file."""
         metadata_file = test_calls.replace('.txt', '_metadata.txt')
         if os.path.exists(metadata_file):
-            with open(metadata_file) as f:
-                self.test_metadata = ast.literal_eval(f.read())
+            metadata = _load_lab_json(metadata_file)
+            # Older labs stored tracked values ({name: value}) instead of argument positions
+            if not all(isinstance(positions, dict) and all(isinstance(pos, int) for pos in positions.values())
+                       for positions in metadata):
+                raise _outdated_lab_error(metadata_file)
+            self.test_metadata = metadata
     
     def _write_test_execution(self, file, test_calls):
         """Write test execution code with mutation tracking."""
@@ -130,25 +281,37 @@ class Grader:
         with open(test_calls) as f:
             lines = [line.strip() for line in f if line.strip()]
             for idx, line in enumerate(lines):
-                tracked_values = self.test_metadata[idx] if idx < len(self.test_metadata) else {}
+                tracked_positions = self.test_metadata[idx] if idx < len(self.test_metadata) else {}
                 
-                if tracked_values:
-                    # Create variables for tracked params
-                    for param_name, value in tracked_values.items():
+                # Build each test case's code as one string so it costs a single write
+                if tracked_positions:
+                    # Bind tracked args to variables, using the call's own argument source text
+                    call = ast.parse(line, mode='eval').body
+                    args = [ast.get_source_segment(line, arg) for arg in call.args]
+                    parts = []
+                    for param_name, pos in tracked_positions.items():
                         var_name = f"_{param_name}"
-                        file.write(f"{var_name} = {repr(value)}\n")
-                        # Replace value with var in the call
-                        line = line.replace(repr(value), var_name, 1)
+                        parts.append(f"{var_name} = {args[pos]}\n")
+                        args[pos] = var_name
                     
                     # Execute and capture return + heap
-                    file.write(f"_ret = {line}\n")
-                    heap = "{" + ", ".join([f"'{p}': _{p}" for p in tracked_values.keys()]) + "}"
-                    file.write(f"_results.append({{'return_value': _ret, 'heap_param_values': {heap}}})\n")
+                    method = ast.get_source_segment(line, call.func)
+                    heap = "{" + ", ".join([f"'{p}': _{p}" for p in tracked_positions.keys()]) + "}"
+                    parts.append(f"_ret = {method}({','.join(args)})\n")
+                    parts.append(f"_results.append({{'return_value': _ret, 'heap_param_values': {heap}}})\n")
+                    file.write(''.join(parts))
                 else:
                     # Just capture return value
                     file.write(f"_results.append({{'return_value': {line}, 'heap_param_values': {{}}}})\n")
         
-        file.write('print(_results)\n')
+        # JSON is much cheaper to parse than a repr; see RESULTS_ENCODER for how values map
+        file.write(RESULTS_ENCODER)
+    
+    @functools.cached_property
+    def _solution_src(self):
+        """solution.py source, read once per Grader (a lab's solution doesn't change under it)."""
+        with open(os.path.join(self.solution_folder, "solution.py")) as f:
+            return f.read()
     
     def generate_answer_key(self, test_calls=None, output=None):
         """Run solution with test calls and save outputs."""
@@ -157,34 +320,47 @@ class Grader:
         if output is None:
             output = os.path.join(self.solution_folder, "answer_key.txt")
             
-        temp = tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False)
+        script = io.StringIO()
         
-        try:
-            # Embed solution code
-            solution_path = os.path.join(self.solution_folder, "solution.py")
-            temp.write(open(solution_path).read())
-            temp.write('\n\n')
-            
-            # Write test execution code
-            self._write_test_execution(temp, test_calls)
-            temp.close()
+        # Embed solution code
+        script.write(self._solution_src)
+        script.write('\n\n')
+        
+        # Write test execution code
+        self._write_test_execution(script, test_calls)
+        source = script.getvalue()
+        
+        # The answer key is a pure function of the generated script (solution + test calls),
+        # so reuse a previous run's output when the exact same script was already executed
+        key = hashlib.blake2b(source.encode('utf-8'), digest_size=16).hexdigest()
+        cache_dir = os.path.join(os.path.dirname(self.solution_folder), ".cache")
+        cached = os.path.join(cache_dir, f"{key}.txt")
+        
+        if os.path.exists(cached):
+            shutil.copy(cached, output)
+            try:
+                os.utime(cached)  # Mark as recently used so pruning keeps it
+            except FileNotFoundError:
+                pass
+        else:
+            # Solution is trusted: run it in the warm worker, no sandbox and no interpreter startup
+            result = _run_in_worker(source, timeout=5)
             
-            # Run directly without sandbox
-            result = subprocess.run(
-                ['python', temp.name],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
+            if not result['success']:
+                raise RuntimeError(f"Failed: {result['stderr']}")
             
-            if result.returncode == 0:
-                with open(output, 'w') as f:
-                    f.write(result.stdout.strip())
-                return output
-            else:
-                raise RuntimeError(f"Failed: {result.stderr}")
-        finally:
-            os.unlink(temp.name)
+            answers = result['stdout'].strip()
+            _write_atomic(output, answers)
+            os.makedirs(cache_dir, exist_ok=True)
+            _write_atomic(cached, answers)
+            _prune_cache(cache_dir)
+        
+        # Per-case digests let grading skip deep comparisons for passing cases
+        with open(output) as f:
+            digests = [_result_digest(case) for case in json.load(f)]
+        _write_atomic(output.replace('.txt', '_digests.txt'), json.dumps(digests))
+        
+        return output
     
     def create_test_suite(self):
         """Generate test calls and answer key."""
@@ -192,64 +368,89 @@ class Grader:
         answer_key = self.generate_answer_key(test_calls)
         return test_calls, answer_key
     
+    def _load_answer_key(self):
+        """Load expected results and, if present, their per-case digests."""
+        answer_key = os.path.join(self.solution_folder, "answer_key.txt")
+        expected_results = _load_lab_json(answer_key)
+        
+        answer_digests = answer_key.replace('.txt', '_digests.txt')
+        expected_digests = []
+        if os.path.exists(answer_digests):
+            expected_digests = _load_lab_json(answer_digests)
+        
+        return expected_results, expected_digests
+    
+    def _compare_results(self, student_results, expected_results, expected_digests):
+        """Score parsed student results against the answer key."""
+        total = len(expected_results)
+        passed = 0
+        results = []
+        
+        for i, (student, expected) in enumerate(zip(student_results, expected_results)):
+            # Matching digest means an identical case: pass without the deep comparison
+            if i < len(expected_digests) and _result_digest(student) == expected_digests[i]:
+                passed += 1
+                results.append({"test": i + 1, "passed": True})
+                continue
+            
+            return_match = student['return_value'] == expected['return_value']
+            heap_match = student['heap_param_values'] == expected['heap_param_values']
+            match = return_match and heap_match
+            
+            if match:
+                passed += 1
+            results.append({
+                "test": i + 1,
+                "passed": match,
+                "expected_return": expected['return_value'],
+                "got_return": student['return_value'],
+                "expected_heap": expected['heap_param_values'],
+                "got_heap": student['heap_param_values']
+            })
+        
+        return {
+            "passed": passed,
+            "total": total,
+            "results": results,
+            "error": None
+        }
+    
     def grade_submission(self, student_name):
         """Grade a student's submission against the answer key."""
         test_calls = os.path.join(self.solution_folder, "test_calls.txt")
-        answer_key = os.path.join(self.solution_folder, "answer_key.txt")
         student_path = os.path.join(self.solution_folder, "Submissions", student_name, "main.py")
         
-        temp = tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False)
+        script = io.StringIO()
+        
+        # Embed student code
+        with open(student_path) as f:
+            script.write(f.read())
+        script.write('\n\n')
+        
+        # Write test execution code; load the answer key up front so an outdated lab fails fast
+        try:
+            expected = self._load_answer_key()
+            self._write_test_execution(script, test_calls)
+        except ValueError as e:
+            return {"error": str(e), "passed": 0, "total": 0, "results": []}
+        script_path = _write_script(script.getvalue())
         
         try:
-            # Embed student code
-            temp.write(open(student_path).read())
-            temp.write('\n\n')
-            
-            # Write test execution code
-            self._write_test_execution(temp, test_calls)
-            temp.close()
-            
             # Run student code in sandbox
-            result = run_script(temp.name, timeout=5)
+            result = run_script(script_path, timeout=5)
             
             if not result['success']:
                 return {"error": result['stderr'], "passed": 0, "total": 0, "results": []}
             
-            # Parse student results and answer key
-            student_results = ast.literal_eval(result['stdout'].strip())
-            with open(answer_key) as f:
-                expected_results = ast.literal_eval(f.read().strip())
-            
-            # Compare results
-            total = len(expected_results)
-            passed = 0
-            results = []
-            
-            for i, (student, expected) in enumerate(zip(student_results, expected_results)):
-                return_match = student['return_value'] == expected['return_value']
-                heap_match = student['heap_param_values'] == expected['heap_param_values']
-                match = return_match and heap_match
-                
-                if match:
-                    passed += 1
-                results.append({
-                    "test": i + 1,
-                    "passed": match,
-                    "expected_return": expected['return_value'],
-                    "got_return": student['return_value'],
-                    "expected_heap": expected['heap_param_values'],
-                    "got_heap": student['heap_param_values']
-                })
-            
-            return {
-                "passed": passed,
-                "total": total,
-                "results": results,
-                "error": None
-            }
+            # Parse student results and compare with the answer key
+            try:
+                student_results = _check_results(json.loads(result['stdout']))
+            except ValueError as e:
+                return {"error": f"Could not parse results: {e}", "passed": 0, "total": 0, "results": []}
+            return self._compare_results(student_results, *expected)
             
         finally:
-            os.unlink(temp.name)
+            os.unlink(script_path)
 
 
 # Example usage
@@ -2,8 +2,221 @@
 Sandbox runner for executing Python scripts using nsjail in WSL
 """
 
-import subprocess
+import atexit
+import json
+import multiprocessing
 import os
+import secrets
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+
+# Resolved once so each run skips the PATH lookup (None: let subprocess resolve "wsl")
+WSL_EXE = shutil.which("wsl")
+
+NSJAIL = ("wsl", "-e", "sudo", "/usr/local/sbin/nsjail")
+
+# Filesystem/namespace args identical on every run; per-run limits are appended to these
+JAIL_BASE = (
+    "--disable_clone_newuser",
+    "-R", "/usr",
+    "-R", "/lib", "-R", "/lib64",
+    "-R", "/etc", "-R", "/dev/null",
+    "--cwd", "/app",
+)
+
+# Persistent nsjail listener (-Ml): each TCP connection gets a fresh jailed worker.py.
+# Loopback only: anyone who can connect can run code in the jail
+LISTENER_HOST = "127.0.0.1"
+LISTENER_PORT = 9999
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py")
+
+# Limits of the running listener, exported by the process that started it so grading pool
+# children use that one listener instead of each trying to start their own
+LISTENER_ENV = "GRADER_SANDBOX_LISTENER"
+
+# Seconds to wait for a newly started listener to accept connections
+LISTENER_START_TIMEOUT = 5
+
+_listener = None  # Popen of the listener this process started, kept for shutdown at exit
+_listener_owner = None  # pid of the process that started _listener
+_listener_started = False  # at most one start attempt per process, never retried
+# Limits of the listener runs are routed to; None when there is none to use
+_listener_limits = tuple(json.loads(os.environ[LISTENER_ENV])) if LISTENER_ENV in os.environ else None
+_listener_lock = threading.Lock()
+
+# WSL dir scripts are written into directly (via its \\wsl$ path) so they can be bind-mounted.
+# Prefer tmpfs (/dev/shm) so staged scripts never touch disk; /tmp is the fallback
+STAGING_DIR_CANDIDATES = ("/dev/shm/grader-staging", "/tmp/grader-staging")
+STAGING_DIR = None
+_staging_windows_dir = None
+
+
+def _to_wsl_path(path):
+    """Convert a Windows path to its /mnt/<drive>/... WSL path."""
+    abs_path = os.path.abspath(path)
+    drive = abs_path[0].lower()
+    return f"/mnt/{drive}{abs_path[2:].replace(chr(92), '/')}"
+
+
+def staging_dir():
+    """
+    Windows path of the WSL staging dir, created on first use.
+    
+    Scripts written here are bind-mounted straight into the jail, skipping the
+    per-run wsl cp / wsl rm. Returns None when WSL can't provide the dir.
+    """
+    global STAGING_DIR, _staging_windows_dir
+    
+    if _staging_windows_dir is None:
+        _staging_windows_dir = ""
+        for candidate in STAGING_DIR_CANDIDATES:
+            try:
+                made = subprocess.run(["wsl", "mkdir", "-p", candidate], executable=WSL_EXE, capture_output=True)
+                if made.returncode != 0:
+                    continue
+                result = subprocess.run(["wsl", "wslpath", "-w", candidate], executable=WSL_EXE,
+                                        capture_output=True, text=True)
+            except OSError:
+                break
+            
+            path = result.stdout.strip()
+            if result.returncode == 0 and os.path.isdir(path):
+                STAGING_DIR, _staging_windows_dir = candidate, path
+                break
+    
+    return _staging_windows_dir or None
+
+
+def _jail_args(timeout, memory_limit, max_cpus, allow_network, max_file_size):
+    """nsjail filesystem and resource-limit args shared by one-shot and listener modes."""
+    args = (
+        *JAIL_BASE,
+        "-t", str(timeout),
+        "--rlimit_as", str(memory_limit),  # Memory limit
+        "--rlimit_cpu", str(timeout),  # CPU time limit
+        "--rlimit_fsize", str(max_file_size),  # Max file size
+        "--max_cpus", str(max_cpus),  # CPU count limit
+    )
+    
+    # Network isolation
+    if not allow_network:
+        args += ("--disable_clone_newnet",)
+    
+    return args
+
+
+def _start_listener(limits):
+    """Launch the nsjail listener in the background for the given resource limits."""
+    global _listener, _listener_owner, _listener_started, _listener_limits
+    
+    _listener_started = True
+    
+    # Port already taken (e.g. another server's listener, with unknown limits): leave it alone
+    if _listener_accepting():
+        return
+    
+    wsl_worker = "/tmp/grader_worker.py"
+    subprocess.run(["wsl", "cp", _to_wsl_path(WORKER_SCRIPT), wsl_worker], executable=WSL_EXE, capture_output=True)
+    
+    cmd = (
+        *NSJAIL,
+        "-Ml", "--bindhost", LISTENER_HOST, "--port", str(LISTENER_PORT),
+        *_jail_args(*limits),
+        "-R", f"{wsl_worker}:/app/worker.py",
+        "--", "/usr/bin/python3", "-I", "-B", "/app/worker.py",
+    )
+    try:
+        _listener = subprocess.Popen(cmd, executable=WSL_EXE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        return
+    _listener_owner = os.getpid()
+    atexit.register(_stop_listener)
+    
+    # Popen returns before nsjail is listening: only route runs to it once it accepts
+    deadline = time.monotonic() + LISTENER_START_TIMEOUT
+    while not _listener_accepting():
+        if _listener.poll() is not None or time.monotonic() > deadline:
+            _stop_listener()  # Never came up (e.g. couldn't bind): one-shot runs from now on
+            return
+        time.sleep(0.05)
+    
+    _listener_limits = limits
+    os.environ[LISTENER_ENV] = json.dumps(limits)
+
+
+def _listener_accepting():
+    """Whether something accepts connections on the listener port."""
+    try:
+        socket.create_connection((LISTENER_HOST, LISTENER_PORT), timeout=0.5).close()
+        return True
+    except OSError:
+        return False
+
+
+def _stop_listener():
+    """Shut down the listener this process started (registered with atexit)."""
+    if _listener is None or _listener_owner != os.getpid() or _listener.poll() is not None:
+        return
+    
+    _listener.terminate()
+    # Terminating the wsl client doesn't always reach nsjail inside WSL. Anchored on nsjail's
+    # own command line so it can't match the sudo/wsl wrappers (or this pkill) around it
+    pattern = f"^{NSJAIL[-1]} -Ml --bindhost {LISTENER_HOST.replace('.', chr(92) + '.')} --port {LISTENER_PORT} "
+    try:
+        subprocess.run(["wsl", "-e", "sudo", "pkill", "-f", pattern], executable=WSL_EXE,
+                       capture_output=True, timeout=5)
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+
+
+def _forget_listener():
+    """Stop routing runs to the listener after it exited; it is never restarted."""
+    global _listener_limits
+    
+    _listener_limits = None
+    os.environ.pop(LISTENER_ENV, None)
+
+
+def _run_via_listener(script_path, timeout):
+    """Send a script to the running listener and read back the worker.py reply."""
+    with open(script_path, 'rb') as f:
+        source = f.read()
+    request_id = secrets.token_hex(8)
+    
+    with socket.create_connection((LISTENER_HOST, LISTENER_PORT), timeout=timeout + 2) as conn:
+        conn.sendall(b'%d %s\n' % (len(source), request_id.encode('ascii')) + source)
+        conn.shutdown(socket.SHUT_WR)
+        
+        chunks = []
+        try:
+            while chunk := conn.recv(65536):
+                chunks.append(chunk)
+        except socket.timeout:
+            return {
+                "returncode": -1,
+                "stdout": "",
+                "stderr": f"Timeout after {timeout}s",
+                "success": False
+            }
+    
+    # worker.py sends exactly one reply line, tagged with this request's id
+    lines = b''.join(chunks).strip().splitlines()
+    if not lines:
+        return {
+            "returncode": -1,
+            "stdout": "",
+            "stderr": f"Timeout after {timeout}s or sandbox killed the process",
+            "success": False
+        }
+    
+    reply = json.loads(lines[-1])
+    if not isinstance(reply, dict) or reply.get("request_id") != request_id:
+        raise ValueError("Listener reply does not match the request")
+    return reply
 
 
 def run_script(script_path, stdin_input="", timeout=2, memory_limit=512, 
@@ -11,6 +224,11 @@ def run_script(script_path, stdin_input="", timeout=2, memory_limit=512,
     """
     Run a Python script in nsjail sandbox via WSL.
     
+    The first call in the main process starts a persistent nsjail listener with that call's
+    limits (once; it is not relaunched if it dies, and it is stopped at exit). Calls with the
+    same limits and no stdin, including from grading pool children, are served by it,
+    skipping the wsl/nsjail cold start.
+    
     Args:
         script_path: Path to Python script (Windows path or filename)
         stdin_input: Input to pass via stdin
@@ -23,43 +241,59 @@ def run_script(script_path, stdin_input="", timeout=2, memory_limit=512,
     Returns:
         dict with: returncode, stdout, stderr, success
     """
-    # Convert Windows path to WSL path
-    abs_path = os.path.abspath(script_path)
-    drive = abs_path[0].lower()
-    wsl_source = f"/mnt/{drive}{abs_path[2:].replace(chr(92), '/')}"
+    limits = (timeout, memory_limit, max_cpus, allow_network, max_file_size)
     
-    # Copy to WSL /tmp (nsjail has issues with /mnt paths)
-    wsl_temp = f"/tmp/{os.path.basename(script_path)}"
-    copy_cmd = ["wsl", "cp", wsl_source, wsl_temp]
-    subprocess.run(copy_cmd, capture_output=True)
+    with _listener_lock:
+        if (_listener_limits is not None and _listener is not None
+                and _listener_owner == os.getpid() and _listener.poll() is not None):
+            _forget_listener()  # Exited
+        
+        if (not _listener_started and _listener_limits is None
+                and multiprocessing.parent_process() is None):
+            # Cold start: launch the listener and wait until it accepts connections
+            _start_listener(limits)
+        
+        listener_ready = _listener_limits == limits
     
-    # Build nsjail command
-    cmd = [
-        "wsl", "-e", "sudo", "/usr/local/sbin/nsjail",
-        "-Mo", 
-        "-t", str(timeout),
-        "--disable_clone_newuser",
-        "-R", "/usr",
-        "-R", "/lib", "-R", "/lib64",
-        "-R", "/etc", "-R", "/dev/null",
-        "--cwd", "/app",
-        "-R", f"{wsl_temp}:/app/script.py",
-        "--rlimit_as", str(memory_limit),  # Memory limit
-        "--rlimit_cpu", str(timeout),  # CPU time limit
-        "--rlimit_fsize", str(max_file_size),  # Max file size
-        "--max_cpus", str(max_cpus),  # CPU count limit
-    ]
+    if listener_ready and not stdin_input:
+        try:
+            return _run_via_listener(script_path, timeout)
+        except (OSError, ValueError):
+            pass  # Listener unreachable (this time) or reply garbled: fall back to a one-shot jail
     
-    # Network isolation
-    if not allow_network:
-        cmd.append("--disable_clone_newnet")
+    return _run_one_shot(script_path, stdin_input, limits)
+
+
+def _run_one_shot(script_path, stdin_input, limits):
+    """Run a script in a freshly exec'd nsjail (the original, per-call path)."""
+    timeout = limits[0]
+    
+    staging = staging_dir()
+    staged = staging is not None and (os.path.normcase(os.path.dirname(os.path.abspath(script_path)))
+                                      == os.path.normcase(staging))
+    
+    if staged:
+        # Already inside WSL: bind-mount it in place
+        wsl_temp = f"{STAGING_DIR}/{os.path.basename(script_path)}"
+    else:
+        # Copy to WSL /tmp (nsjail has issues with /mnt paths)
+        wsl_temp = f"/tmp/{os.path.basename(script_path)}"
+        copy_cmd = ["wsl", "cp", _to_wsl_path(script_path), wsl_temp]
+        subprocess.run(copy_cmd, executable=WSL_EXE, capture_output=True)
     
-    # Python execution
-    cmd.extend(["--", "/usr/bin/python3", "-I", "-B", "/app/script.py"])
+    # Build nsjail command
+    cmd = (
+        *NSJAIL,
+        "-Mo",
+        *_jail_args(*limits),
+        "-R", f"{wsl_temp}:/app/script.py",
+        "--", "/usr/bin/python3", "-I", "-B", "/app/script.py",
+    )
     
     try:
         result = subprocess.run(
             cmd,
+            executable=WSL_EXE,
             input=stdin_input,
             text=True,
             capture_output=True,
@@ -90,8 +324,9 @@ def run_script(script_path, stdin_input="", timeout=2, memory_limit=512,
         }
     
     finally:
-        # Clean up temp file
-        subprocess.run(["wsl", "rm", "-f", wsl_temp], capture_output=True)
+        # Clean up temp copy (staged scripts are removed by their owner)
+        if not staged:
+            subprocess.run(["wsl", "rm", "-f", wsl_temp], executable=WSL_EXE, capture_output=True)
 
 
 # Example usage
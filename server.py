@@ -2,15 +2,19 @@
 Simple HTTP server for autograder
 """
 
+import argparse
 import json
 import os
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 from backend import LabBackend
 
 
 backend = LabBackend()
 
+# Largest POST body accepted (solution/student code uploads)
+MAX_BODY_BYTES = 5 * 1024 * 1024
+
 TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
 
 
@@ -21,6 +25,27 @@ def load_html(filename):
         return f.read()
 
 
+# Templates are static: read and encode them once instead of on every GET
+TEMPLATES = {name: load_html(name).encode('utf-8') for name in ('teacher.html', 'student.html')}
+
+
+# Encoded listing responses: {key: (listing, bytes)}, valid while backend returns the same list object
+_listing_json = {}
+
+
+def encode_listing(key, field, items):
+    """JSON-encode {field: items}, reusing the bytes while the backend's cached listing is unchanged."""
+    hit = _listing_json.get(key)
+    if hit is not None and hit[0] is items:
+        return hit[1]
+    
+    body = json.dumps({field: items}).encode()
+    # Empty lists are fresh objects every call (and missing labs shouldn't grow the cache)
+    if items:
+        _listing_json[key] = (items, body)
+    return body
+
+
 class AutograderHandler(BaseHTTPRequestHandler):
     
     def do_GET(self):
@@ -43,9 +68,40 @@ class AutograderHandler(BaseHTTPRequestHandler):
     def do_POST(self):
         """Handle POST requests"""
         path = urlparse(self.path).path
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length).decode('utf-8')
-        data = parse_qs(post_data)
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            content_length = -1
+        
+        # rfile.read(-1) would read until the client disconnects, bypassing the size cap
+        if content_length < 0:
+            self.send_error(400, "Invalid Content-Length")
+            return
+        
+        # Reject oversized bodies before reading them
+        if content_length > MAX_BODY_BYTES:
+            self.send_error(413, "Request body too large")
+            return
+        
+        body = self.rfile.read(content_length)
+        
+        # JSON bodies decode in one pass; form-encoded bodies are still accepted from the HTML forms
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            try:
+                data = json.loads(body)
+            except ValueError:
+                self.send_error(400, "Invalid JSON body")
+                return
+            
+            if not isinstance(data, dict):
+                self.send_error(400, "JSON body must be an object")
+                return
+        else:
+            try:
+                data = {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()}
+            except UnicodeDecodeError:
+                self.send_error(400, "Form body is not valid UTF-8")
+                return
         
         if path == "/api/create_lab":
             self.create_lab(data)
@@ -53,56 +109,65 @@ class AutograderHandler(BaseHTTPRequestHandler):
             self.submit_code(data)
         elif path == "/api/grade":
             self.grade_submission(data)
+        elif path == "/api/grade_all":
+            self.grade_all_submissions(data)
         else:
             self.send_error(404, "Not Found")
     
     def send_teacher_page(self):
         """Send teacher interface HTML"""
-        html = load_html('teacher.html')
+        body = TEMPLATES['teacher.html']
         
         self.send_response(200)
-        self.send_header('Content-type', 'text/html')
+        self.send_header('Content-type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(html.encode())
+        self.wfile.write(body)
     
     def send_student_page(self):
         """Send student interface HTML"""
-        html = load_html('student.html')
+        body = TEMPLATES['student.html']
         
         self.send_response(200)
-        self.send_header('Content-type', 'text/html')
+        self.send_header('Content-type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(html.encode())
+        self.wfile.write(body)
     
     def send_labs_list(self):
         """Send list of labs as JSON"""
-        labs = backend.list_labs()
-        response = json.dumps({"labs": labs})
+        body = encode_listing(("labs",), "labs", backend.list_labs())
         
         self.send_response(200)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(response.encode())
+        self.wfile.write(body)
     
     def send_students_list(self, lab_name):
         """Send list of students for a lab"""
-        students = backend.list_students(lab_name) if lab_name else []
-        response = json.dumps({"students": students})
+        try:
+            students = backend.list_students(lab_name) if lab_name else []
+        except ValueError:
+            students = []
+        body = encode_listing(("students", lab_name), "students", students)
         
         self.send_response(200)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(response.encode())
+        self.wfile.write(body)
     
     def create_lab(self, data):
         """Create a new lab"""
         try:
-            lab_name = data['lab_name'][0]
-            solution_code = data['solution_code'][0]
+            lab_name = data['lab_name']
+            solution_code = data['solution_code']
             
-            # Parse test configuration from JSON
-            test_config_json = data.get('test_config_json', ['[]'])[0]
-            test_config = json.loads(test_config_json)
+            # Parse test configuration (a JSON string from the form, or already a list in JSON bodies)
+            test_config = data.get('test_config_json', '[]')
+            if isinstance(test_config, str):
+                test_config = json.loads(test_config)
             
             print(f"Creating lab '{lab_name}' with {len(test_config)} tests")
             print(f"Test config: {test_config}")
@@ -139,9 +204,9 @@ class AutograderHandler(BaseHTTPRequestHandler):
     def submit_code(self, data):
         """Submit student code"""
         try:
-            lab_name = data['lab_name'][0]
-            student_name = data['student_name'][0]
-            student_code = data['student_code'][0]
+            lab_name = data['lab_name']
+            student_name = data['student_name']
+            student_code = data['student_code']
             
             # Submit the code
             path = backend.submit_student_code(lab_name, student_name, student_code)
@@ -171,8 +236,8 @@ class AutograderHandler(BaseHTTPRequestHandler):
     def grade_submission(self, data):
         """Grade a student submission"""
         try:
-            lab_name = data['lab_name_grade'][0]
-            student_name = data['student_name_grade'][0]
+            lab_name = data['lab_name_grade']
+            student_name = data['student_name_grade']
             
             # Grade the submission
             result = backend.grade_student(lab_name, student_name)
@@ -197,12 +262,29 @@ class AutograderHandler(BaseHTTPRequestHandler):
             self.send_header('Content-type', 'application/json')
             self.end_headers()
             self.wfile.write(response.encode())
+    
+    def grade_all_submissions(self, data):
+        """Grade every student in a lab, streaming one JSON object per line as each finishes"""
+        lab_name = data.get('lab_name_grade', '')
+        
+        self.send_response(200)
+        self.send_header('Content-type', 'application/x-ndjson')
+        self.end_headers()
+        
+        try:
+            for student_name, result in backend.iter_grade_all_students(lab_name):
+                line = json.dumps({"student": student_name, **result})
+                self.wfile.write(line.encode() + b'\n')
+                self.wfile.flush()
+        except Exception as e:
+            line = json.dumps({"error": "Failed to grade submissions", "details": str(e)})
+            self.wfile.write(line.encode() + b'\n')
 
 
 def run_server(port=8000):
     """Run the HTTP server"""
     server_address = ('', port)
-    httpd = HTTPServer(server_address, AutograderHandler)
+    httpd = ThreadingHTTPServer(server_address, AutograderHandler)
     print(f"Server running on http://localhost:{port}")
     print(f"Teacher interface: http://localhost:{port}/teacher")
     print(f"Student interface: http://localhost:{port}/student")
@@ -210,4 +292,11 @@ def run_server(port=8000):
 
 
 if __name__ == "__main__":
-    run_server()
+    parser = argparse.ArgumentParser(description="Autograder HTTP server")
+    parser.add_argument("-p", "--port", type=int, default=8000)
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Max students graded concurrently across all requests (default: CPU count)")
+    args = parser.parse_args()
+    
+    backend.max_workers = args.jobs
+    run_server(args.port)
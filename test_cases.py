@@ -2,18 +2,109 @@
 Test Case Generator - Simple version
 """
 
+import functools
 import random
+import re
+import sys
+
+
+# Byte translation table: 0x20 (the ASCII case bit) for ASCII letters, 0 for everything else
+_CASE_BIT = bytes(0x20 if chr(b).isascii() and chr(b).isalpha() else 0 for b in range(256))
+
+# Above this many substring excludes, one compiled alternation beats a Python loop over them
+SUBSTRING_REGEX_THRESHOLD = 4
+
+# Unique ints are sampled straight from the enumerated valid values when there are at most this many
+SMALL_DOMAIN_SIZE = 10_000
+
+# choices() maps random() floats onto a sequence, which is only uniform up to 2**53 values
+EXACT_CHOICES_SIZE = 2 ** 53
+
+
+def _flip_case_bits(data, rng):
+    """Randomly flip the case of each ASCII letter in data (bytes) using rng."""
+    if not data:
+        return data
+    
+    # Branchless: XOR the case bit of every letter with one random bit, on the whole buffer at once
+    letters = int.from_bytes(data.translate(_CASE_BIT), 'big')
+    flips = letters & rng.getrandbits(8 * len(data))
+    return (int.from_bytes(data, 'big') ^ flips).to_bytes(len(data), 'big')
+
+
+def _random_case(value, rng):
+    """Randomly upper/lower-case each letter of value (like a per-char coin flip) using rng."""
+    if not value.isascii():
+        return ''.join(c.upper() if rng.random() < 0.5 else c.lower() for c in value)
+    
+    return _flip_case_bits(value.encode('ascii'), rng).decode('ascii')
+
+
+def _apply_case(value, case, rng):
+    """Apply a generate_string case option to one value."""
+    if case == "upper":
+        return value.upper()
+    if case == "lower":
+        return value.lower()
+    if case == "random":
+        return _random_case(value, rng)
+    return value
+
+
+@functools.lru_cache(maxsize=16)
+def _char_table(lower, upper):
+    """All characters with code points in [lower, upper], as one str to index into."""
+    return ''.join(map(chr, range(lower, upper + 1)))
+
+
+def _fill_column(column, total_tests, config):
+    """
+    Stretch a generated column to total_tests values by cycling it (like param values in
+    Grader.generate_test_calls), so a short column never drops rows when columns are zipped.
+    """
+    if len(column) >= total_tests:
+        return column
+    if not column:
+        raise ValueError(f"{config.get('type')} config produced no values: {config!r}")
+    return [column[i % len(column)] for i in range(total_tests)]
+
+
+def _constant(value):
+    """Generator function that always returns value."""
+    def generate(total_tests=10):
+        return [value] * total_tests
+    return generate
 
 
 class TestCaseGenerator:
     """Generates test cases based on configuration."""
     
+    # bool_or_none value pools, indexed by (include_true << 2) | (include_false << 1) | include_none
+    _POOL_TABLE = tuple(
+        tuple(v for v, bit in ((True, 4), (False, 2), (None, 1)) if key & bit)
+        for key in range(8)
+    )
+    
+    # Config "type" -> generator method name, for top-level and nested configs
+    _DISPATCH = {
+        "num": "generate_num",
+        "string": "generate_string",
+        "bool_or_none": "generate_bool_or_none",
+        "array": "generate_array",
+        "dict": "generate_dict",
+    }
+    
+    @classmethod
+    def _bool_pool(cls, include_true=True, include_false=True, include_none=True):
+        """The tuple of values a bool_or_none config with these flags can produce."""
+        return cls._POOL_TABLE[(bool(include_true) << 2) | (bool(include_false) << 1) | bool(include_none)]
+    
     def __init__(self, seed=None):
         """Initialize generator with optional seed for reproducibility."""
-        if seed is not None:
-            random.seed(seed)
+        # Per-instance RNG: seeding never touches the global random module
+        self._rng = random.Random(seed)
     
-    def generate_num(self, lower=0, upper=100, decimal=None, exclude=None, total_tests=10):
+    def generate_num(self, lower=0, upper=100, decimal=None, exclude=None, total_tests=10, unique=True):
         """Generate number test cases.
         
         Args:
@@ -22,27 +113,86 @@ class TestCaseGenerator:
             decimal: None for int, or number of decimal places for float
             exclude: List of numbers to exclude
             total_tests: Number of tests to generate
+            unique: Whether the generated values must all differ
         """
         exclude = exclude or []
-        results = []
-        attempts = 0
         max_attempts = total_tests * 100
         
+        # Normalize exclude to the type actually generated, so lookups never compare int to float.
+        # Non-numbers (e.g. "3") could never equal a generated value, so they are dropped
+        if decimal is None:
+            # 3.0 excludes 3; 3.5 can never be drawn, so it is dropped. Ints stay exact at any size
+            exclude = frozenset(x if isinstance(x, int) else int(x) for x in exclude
+                                if isinstance(x, int) or (isinstance(x, float) and x.is_integer()))
+            return self._generate_ints(int(lower), int(upper), exclude, total_tests, max_attempts, unique)
+        
+        # Rounded like the candidates, so 0.1 + 0.2 still excludes 0.3 at decimal=2
+        exclude = frozenset(round(x, decimal) for x in exclude if isinstance(x, (int, float)))
+        return self._generate_floats(lower, upper, decimal, exclude, total_tests, max_attempts, unique)
+    
+    def _generate_floats(self, lower, upper, decimal, exclude, total_tests, max_attempts, unique=True):
+        """Rounded floats in [lower, upper] minus exclude, drawn in doubling batches (same attempt budget)."""
+        rand = self._rng.random
+        span = upper - lower
+        # Insertion-ordered set when unique: keeps first-drawn order while deduplicating
+        results = {} if unique else []
+        attempts = 0
+        batch = total_tests * 2
+        
         while len(results) < total_tests and attempts < max_attempts:
-            attempts += 1
-            
-            if decimal is None:
-                value = random.randint(int(lower), int(upper))
+            batch = min(batch, max_attempts - attempts)
+            attempts += batch
+            # uniform() inlined (lower + span * random()) and rounded in one comprehension per batch
+            drawn = [v for v in (round(lower + span * rand(), decimal) for _ in range(batch)) if v not in exclude]
+            if unique:
+                results.update(dict.fromkeys(drawn))
             else:
-                value = round(random.uniform(lower, upper), decimal)
-            
-            if value not in exclude and value not in results:
-                results.append(value)
+                results.extend(drawn)
+            batch *= 2
         
-        return results
+        return list(results)[:total_tests]
+    
+    def _generate_ints(self, lower, upper, exclude, total_tests, max_attempts, unique=True):
+        """Ints in [lower, upper] minus exclude, drawn in doubling batches (same attempt budget)."""
+        if lower > upper:
+            raise ValueError(f"empty range: lower={lower} > upper={upper}")
+        
+        domain = range(lower, upper + 1)
+        size = upper - lower + 1  # len(domain) overflows past sys.maxsize
+        
+        if unique and not exclude and size <= sys.maxsize:
+            # Nothing to reject: draw distinct values directly, without the attempt loop
+            return self._rng.sample(domain, min(total_tests, size))
+        
+        if unique and size - len(exclude) <= SMALL_DOMAIN_SIZE:
+            # Small enough to list every valid value: exact-size sample, no rejection or attempt cap
+            valid = [v for v in domain if v not in exclude]
+            return self._rng.sample(valid, min(total_tests, len(valid)))
+        
+        # Insertion-ordered set when unique: keeps first-drawn order while deduplicating
+        results = {} if unique else []
+        attempts = 0
+        batch = total_tests * 2
+        
+        while len(results) < total_tests and attempts < max_attempts:
+            batch = min(batch, max_attempts - attempts)
+            attempts += batch
+            if size <= EXACT_CHOICES_SIZE:
+                # One choices() call per batch instead of one randint() call per attempt
+                drawn = [v for v in self._rng.choices(domain, k=batch) if v not in exclude]
+            else:
+                # randrange() is exact for any range size
+                drawn = [v for v in (self._rng.randrange(lower, upper + 1) for _ in range(batch)) if v not in exclude]
+            if unique:
+                results.update(dict.fromkeys(drawn))
+            else:
+                results.extend(drawn)
+            batch *= 2
+        
+        return list(results)[:total_tests]
     
     def generate_string(self, lower_len=0, upper_len=10, char_range=(32, 126), 
-                       exclude=None, case=None, total_tests=10):
+                       exclude=None, case=None, total_tests=10, unique=True):
         """Generate string test cases.
         
         Args:
@@ -52,38 +202,75 @@ class TestCaseGenerator:
             exclude: List of strings/substrings to exclude
             case: None (no change), "upper" (all caps), "lower" (all lowercase), or "random" (random caps)
             total_tests: Number of tests to generate
+            unique: Whether the generated strings must all differ
         """
         exclude = exclude or []
+        exact_exclude = frozenset(exclude)
+        if len(exclude) > SUBSTRING_REGEX_THRESHOLD:
+            contains_excluded = re.compile('|'.join(map(re.escape, exclude))).search
+        else:
+            contains_excluded = lambda value: any(excl in value for excl in exclude)
         results = []
+        seen = set()  # Mirrors results for O(1) membership checks
         attempts = 0
         max_attempts = total_tests * 100
         
         while len(results) < total_tests and attempts < max_attempts:
-            attempts += 1
-            
-            length = random.randint(lower_len, upper_len)
-            value = ''.join(chr(random.randint(char_range[0], char_range[1])) 
-                          for _ in range(length))
+            # Sample a whole batch of candidates at once; each one still counts as an attempt
+            batch = min((total_tests - len(results)) * 2, max_attempts - attempts)
+            attempts += batch
             
-            # Apply case transformation
+            for value in self._random_strings(lower_len, upper_len, char_range, batch, case):
+                # Skip if excluded or contains excluded substring
+                if value in exact_exclude or contains_excluded(value):
+                    continue
+                
+                if unique and value in seen:
+                    continue
+                
+                results.append(value)
+                seen.add(value)
+                if len(results) == total_tests:
+                    break
+        
+        return results
+    
+    def _random_strings(self, lower_len, upper_len, char_range, count, case=None):
+        """Generate count random strings, case applied, from one flat sample of lengths and characters."""
+        lengths = self._rng.choices(range(lower_len, upper_len + 1), k=count)
+        total = sum(lengths)
+        
+        if char_range[1] <= 127:
+            # ASCII: apply the case option to the whole batch buffer in one pass, then decode once
+            data = bytes(self._rng.choices(range(char_range[0], char_range[1] + 1), k=total))
             if case == "upper":
-                value = value.upper()
+                data = data.upper()
             elif case == "lower":
-                value = value.lower()
+                data = data.lower()
             elif case == "random":
-                value = ''.join(c.upper() if random.random() < 0.5 else c.lower() for c in value)
-            
-            # Skip if excluded or contains excluded substring
-            if value in exclude or any(excl in value for excl in exclude):
-                continue
-            
-            if value not in results:
-                results.append(value)
+                data = _flip_case_bits(data, self._rng)
+            flat = data.decode('ascii')
+            case = None
+        elif char_range[1] <= 255:
+            # Byte-sized code points: sample ints in one call, convert to str with one decode
+            flat = bytes(self._rng.choices(range(char_range[0], char_range[1] + 1), k=total)).decode('latin-1')
+        else:
+            # Wider ranges: pick straight from a prebuilt character table, no chr() per character
+            flat = ''.join(self._rng.choices(_char_table(char_range[0], char_range[1]), k=total))
         
-        return results
+        strings = []
+        start = 0
+        for length in lengths:
+            strings.append(flat[start:start + length])
+            start += length
+        
+        # Non-ASCII case mapping can change a string's length (e.g. "ß".upper()), so it stays per value
+        if case is not None:
+            strings = [_apply_case(value, case, self._rng) for value in strings]
+        return strings
     
     def generate_bool_or_none(self, include_true=True, include_false=True, 
-                             include_none=True, total_tests=10):
+                             include_none=True, total_tests=10, unique=False):
         """Generate bool/None test cases.
         
         Args:
@@ -91,22 +278,61 @@ class TestCaseGenerator:
             include_false: Whether to include False
             include_none: Whether to include None
             total_tests: Number of tests to generate
+            unique: Whether the generated values must all differ (at most one of each
+                    included value, like generate_num/generate_string); False draws with replacement
         """
-        pool = []
+        pool = self._bool_pool(include_true, include_false, include_none)
         
-        if include_true:
-            pool.append(True)
-        
-        if include_false:
-            pool.append(False)
+        if not pool:
+            return []
         
-        if include_none:
-            pool.append(None)
+        if unique:
+            # A random permutation prefix: no per-draw work, never more values than the pool holds
+            return self._rng.sample(pool, min(total_tests, len(pool)))
         
-        if not pool:
+        return self._rng.choices(pool, k=total_tests)
+    
+    def generate_from_config(self, config):
+        """Generate values from a {"type": ..., ...params} config. Unknown types give []."""
+        method_name = self._DISPATCH.get(config.get("type", "num"))
+        if method_name is None:
             return []
         
-        return random.choices(pool, k=total_tests)
+        return getattr(self, method_name)(**{k: v for k, v in config.items() if k != "type"})
+    
+    def _compile_config(self, config, allowed_types=None):
+        """
+        Resolve a nested generator config once, ahead of the per-test loop.
+        
+        Returns:
+            (generate, kwargs) where generate(total_tests=n, **kwargs) returns n values
+        """
+        config_type = config.get("type")
+        if allowed_types is not None and config_type not in allowed_types:
+            raise ValueError(f"Unsupported type {config_type!r} here, expected one of {allowed_types}")
+        
+        method_name = self._DISPATCH.get(config_type)
+        if method_name is None:
+            return _constant(None), {}
+        
+        generate = getattr(self, method_name)
+        kwargs = {k: v for k, v in config.items() if k != "type"}
+        
+        # Nested values are drawn as one column across all tests, but each test samples
+        # its value independently, so repeats between tests stay allowed unless the config
+        # explicitly asks for "unique": True
+        if config_type in ("num", "string"):
+            kwargs.setdefault("unique", False)
+        
+        # A bool_or_none config allowing a single value always produces that value
+        # (a unique one yields it just once, so it goes through the generator)
+        if config_type == "bool_or_none" and not kwargs.get("unique", False):
+            pool = self._bool_pool(kwargs.get("include_true", True), kwargs.get("include_false", True),
+                                   kwargs.get("include_none", True))
+            if len(pool) == 1:
+                return _constant(pool[0]), {}
+        
+        return generate, kwargs
     
     def generate_array(self, elements, total_tests=10):
         """Generate array test cases.
@@ -118,31 +344,15 @@ class TestCaseGenerator:
         Returns:
             List of arrays, each containing elements generated from configs
         """
-        results = []
+        if not elements:
+            return [[] for _ in range(total_tests)]
         
-        for _ in range(total_tests):
-            array = []
-            for element_config in elements:
-                element_type = element_config.get("type")
-                
-                if element_type == "num":
-                    value = self.generate_num(**{k: v for k, v in element_config.items() if k != "type"}, total_tests=1)[0]
-                elif element_type == "string":
-                    value = self.generate_string(**{k: v for k, v in element_config.items() if k != "type"}, total_tests=1)[0]
-                elif element_type == "bool_or_none":
-                    value = self.generate_bool_or_none(**{k: v for k, v in element_config.items() if k != "type"}, total_tests=1)[0]
-                elif element_type == "array":
-                    value = self.generate_array(**{k: v for k, v in element_config.items() if k != "type"}, total_tests=1)[0]
-                elif element_type == "dict":
-                    value = self.generate_dict(**{k: v for k, v in element_config.items() if k != "type"}, total_tests=1)[0]
-                else:
-                    value = None
-                
-                array.append(value)
-            
-            results.append(array)
-        
-        return results
+        # One batched call per element position, then transpose the columns into arrays
+        columns = []
+        for element_config in elements:
+            generate, kwargs = self._compile_config(element_config)
+            columns.append(_fill_column(generate(total_tests=total_tests, **kwargs), total_tests, element_config))
+        return [list(row) for row in zip(*columns)]
     
     def generate_dict(self, keys, values, total_tests=10):
         """Generate dictionary test cases.
@@ -155,44 +365,22 @@ class TestCaseGenerator:
         Returns:
             List of dictionaries with generated keys and values
         """
-        results = []
+        # Keys must be hashable: only scalar generators are allowed
+        pairs = list(zip(keys, values))
+        if not pairs:
+            return [{} for _ in range(total_tests)]
         
-        for _ in range(total_tests):
-            dict_obj = {}
-            
-            for key_config, value_config in zip(keys, values):
-                # Generate key
-                key_type = key_config.get("type")
-                if key_type == "num":
-                    key = self.generate_num(**{k: v for k, v in key_config.items() if k != "type"}, total_tests=1)[0]
-                elif key_type == "string":
-                    key = self.generate_string(**{k: v for k, v in key_config.items() if k != "type"}, total_tests=1)[0]
-                elif key_type == "bool_or_none":
-                    key = self.generate_bool_or_none(**{k: v for k, v in key_config.items() if k != "type"}, total_tests=1)[0]
-                else:
-                    key = None
-                
-                # Generate value
-                value_type = value_config.get("type")
-                if value_type == "num":
-                    value = self.generate_num(**{k: v for k, v in value_config.items() if k != "type"}, total_tests=1)[0]
-                elif value_type == "string":
-                    value = self.generate_string(**{k: v for k, v in value_config.items() if k != "type"}, total_tests=1)[0]
-                elif value_type == "bool_or_none":
-                    value = self.generate_bool_or_none(**{k: v for k, v in value_config.items() if k != "type"}, total_tests=1)[0]
-                elif value_type == "array":
-                    value = self.generate_array(**{k: v for k, v in value_config.items() if k != "type"}, total_tests=1)[0]
-                elif value_type == "dict":
-                    value = self.generate_dict(**{k: v for k, v in value_config.items() if k != "type"}, total_tests=1)[0]
-                else:
-                    value = None
-                
-                dict_obj[key] = value
-            
-            results.append(dict_obj)
+        # One batched call per key/value position, then transpose the columns into dicts
+        key_columns = []
+        value_columns = []
+        for key_config, value_config in pairs:
+            key_generate, key_kwargs = self._compile_config(key_config, allowed_types=("num", "string", "bool_or_none"))
+            value_generate, value_kwargs = self._compile_config(value_config)
+            key_columns.append(_fill_column(key_generate(total_tests=total_tests, **key_kwargs), total_tests, key_config))
+            value_columns.append(_fill_column(value_generate(total_tests=total_tests, **value_kwargs),
+                                              total_tests, value_config))
         
-        return results
-
+        return [dict(zip(key_row, value_row)) for key_row, value_row in zip(zip(*key_columns), zip(*value_columns))]
 
 
 # Example usage
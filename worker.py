@@ -0,0 +1,98 @@
+"""
+Python worker - Runs scripts sent over stdin and replies with their captured output
+
+Used as the warm answer-key interpreter (grader.py) and as the jailed process behind
+the nsjail listener (run_in_sandbox.py).
+
+Protocol (binary stdin/stdout):
+    request:  b"<length> <request_id>\n" followed by <length> bytes of UTF-8 source
+    response: one JSON line {"returncode", "stdout", "stderr", "success", "request_id"}
+
+Replies go out on a private duplicate of fd 1; fds 1 and 2 themselves point at /dev/null,
+so output a script writes straight to them (os.write, os.system, child processes) is
+dropped instead of being mistaken for a reply.
+
+Interpreter state a script commonly changes (builtins, the recursion limit, sys.path,
+newly imported modules) is restored after each run. In-place changes to modules that were
+already loaded are not undone, so the warm worker is only for trusted code.
+"""
+
+import builtins
+import contextlib
+import io
+import json
+import os
+import sys
+import traceback
+
+
+def run_source(source):
+    """Execute source in a fresh namespace, capturing its output like a subprocess would."""
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    returncode = 0
+    
+    saved_builtins = dict(builtins.__dict__)
+    saved_recursion_limit = sys.getrecursionlimit()
+    saved_path = list(sys.path)
+    saved_modules = set(sys.modules)
+    
+    # Solution code must never read the request stream
+    sys.stdin = io.StringIO()
+    
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                exec(compile(source, "<solution>", "exec"), {"__name__": "__main__"})
+            except SystemExit as e:
+                if e.code is None:
+                    returncode = 0
+                elif isinstance(e.code, int):
+                    returncode = e.code
+                else:
+                    print(e.code, file=sys.stderr)
+                    returncode = 1
+            except BaseException:
+                traceback.print_exc()
+                returncode = 1
+    finally:
+        # Undo the script's global changes so they can't leak into the next run
+        builtins.__dict__.clear()
+        builtins.__dict__.update(saved_builtins)
+        sys.setrecursionlimit(saved_recursion_limit)
+        sys.path[:] = saved_path
+        for name in set(sys.modules) - saved_modules:
+            del sys.modules[name]
+    
+    return {
+        "returncode": returncode,
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+        "success": returncode == 0
+    }
+
+
+def main():
+    requests = sys.stdin.buffer
+    replies = os.fdopen(os.dup(1), 'wb')
+    
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    os.close(devnull)
+    
+    while True:
+        header = requests.readline()
+        if not header:
+            break
+        
+        length, _, request_id = header.decode('ascii').partition(' ')
+        source = requests.read(int(length)).decode('utf-8')
+        reply = run_source(source)
+        reply["request_id"] = request_id.strip()
+        replies.write(json.dumps(reply).encode('utf-8') + b'\n')
+        replies.flush()
+
+
+if __name__ == "__main__":
+    main()